@@ -5,36 +5,78 @@
 支持多种音频格式，生成可定制的SVG频谱图
 """
 
+import contextlib
+import copy
+import io
+import itertools
+import math
 import os
 import sys
 import numpy as np
 import librosa
-import toml
+import scipy.fft
+import scipy.signal
+import soundfile as sf
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor, as_completed
 from pathlib import Path
 from typing import Tuple, List
 from tqdm import tqdm
 
+try:
+    import tomllib
+except ImportError:
+    # Python 3.11以下使用tomli
+    import tomli as tomllib
+
+
+# 频谱计算时每块处理的帧数（控制中间数组大小）
+FRAME_BLOCK_SIZE = 256
+# 写入SVG文件的缓冲区大小（字节）
+WRITE_BUFFER_SIZE = 1 << 20
+# 需要通过librosa解码的音频格式（soundfile无法直接读取）
+LIBROSA_ONLY_FORMATS = ('.mp3', '.m4a')
+# Windows下ProcessPoolExecutor允许的最大进程数
+WINDOWS_MAX_WORKERS = 61
+# 各垂直对齐方式对应的y坐标偏移系数
+ALIGN_OFFSETS = {'top': 0.0, 'center': 0.5, 'bottom': 1.0}
+
 
 class AudioSpectrumSVG:
     """音频频谱图SVG生成器类"""
     
-    def __init__(self, config_path: str = "config.toml"):
+    # 已解析的配置文件缓存，键为（绝对路径, 修改时间）
+    _config_cache = {}
+    
+    def __init__(self, config_path: str = "config.toml", config: dict = None):
         """
         初始化生成器
         
         Args:
             config_path: TOML配置文件路径
+            config: 已解析的配置字典，指定时不再读取config_path
         """
-        self.config = self._load_config(config_path)
+        self.config = config if config is not None else self._load_config(config_path)
         self.audio_data = None
         self.sample_rate = None
+        # 按n_fft缓存的汉宁窗和加窗工作区
+        self._fft_cache = {}
+        # FFT使用的线程数（-1表示使用全部CPU核心）
+        self._fft_workers = -1
+        # 是否显示进度条
+        self._show_progress = True
         
     def _load_config(self, config_path: str) -> dict:
-        """加载TOML配置文件"""
+        """加载TOML配置文件（按路径和修改时间缓存解析结果）"""
         try:
-            with open(config_path, 'r', encoding='utf-8') as f:
-                config = toml.load(f)
-            return config
+            key = (os.path.abspath(config_path), os.stat(config_path).st_mtime_ns)
+            config = self._config_cache.get(key)
+            if config is None:
+                with open(config_path, 'rb') as f:
+                    config = tomllib.load(f)
+                self._config_cache[key] = config
+            # 返回副本，避免实例之间共享同一个可变配置
+            return copy.deepcopy(config)
         except FileNotFoundError:
             print(f"错误: 配置文件 '{config_path}' 不存在")
             sys.exit(1)
@@ -67,8 +109,16 @@ class AudioSpectrumSVG:
         
         print(f"正在加载音频文件: {audio_file}")
         
-        # 使用librosa加载音频，自动处理多种格式
-        self.audio_data, self.sample_rate = librosa.load(audio_file, sr=None, mono=True)
+        if ext in LIBROSA_ONLY_FORMATS:
+            # soundfile不支持的压缩格式交给librosa（audioread/ffmpeg）解码
+            self.audio_data, self.sample_rate = librosa.load(audio_file, sr=None, mono=True)
+        else:
+            # 直接用soundfile读取，省去librosa的重采样与格式转换流程
+            audio, self.sample_rate = sf.read(audio_file, dtype='float32', always_2d=False)
+            if audio.ndim == 2:
+                # 多声道取平均转为单声道
+                audio = audio.mean(axis=1, dtype=np.float32)
+            self.audio_data = audio
         
         duration = len(self.audio_data) / self.sample_rate
         print(f"音频加载完成 - 时长: {duration:.2f}秒, 采样率: {self.sample_rate}Hz")
@@ -99,47 +149,83 @@ class AudioSpectrumSVG:
         if num_bars == 0:
             num_bars = int(duration * bars_per_second)
         
-        print(f"生成 {num_bars} 个频谱条")
+        if num_bars <= 0:
+            raise ValueError("音频过短，无法生成频谱条")
         
-        with tqdm(total=100, desc="计算频谱", unit="%") as pbar:
-            # 计算每个频谱条对应的时间窗口
-            hop_length = int(self.sample_rate * time_window)
-            n_fft = min(2048, hop_length * 2)
-            pbar.update(20)
-            
-            # 计算短时傅里叶变换（STFT）
-            stft = librosa.stft(self.audio_data, n_fft=n_fft, hop_length=hop_length)
-            magnitude = np.abs(stft)
-            pbar.update(40)
-            
-            # 获取频率bins
-            freqs = librosa.fft_frequencies(sr=self.sample_rate, n_fft=n_fft)
-            
-            # 选择频率范围内的bins
-            freq_mask = (freqs >= freq_min) & (freqs <= freq_max)
-            magnitude_filtered = magnitude[freq_mask, :]
-            pbar.update(20)
-            
-            # 对每个时间帧，计算能量平均值
-            energy = np.mean(magnitude_filtered, axis=0)
-            pbar.update(20)
+        print(f"生成 {num_bars} 个频谱条")
         
-        # 如果需要的频谱条数量不同于计算出的帧数，进行重采样
+        # 每个频谱条分析的音频片段长度（FFT长度）由时间窗口决定
+        n_fft = int(self.sample_rate * time_window)
+        if n_fft < 2:
+            raise ValueError(f"时间窗口过小: {time_window}秒")
+        
+        # 频率范围对应的bin区间（第k个bin的频率为 k * sr / n_fft，单调递增）
+        i0 = max(0, math.ceil(freq_min * n_fft / self.sample_rate))
+        i1 = min(n_fft // 2 + 1, math.floor(freq_max * n_fft / self.sample_rate) + 1)
+        if i0 >= i1:
+            raise ValueError(f"频率范围 {freq_min}-{freq_max}Hz 内没有可用的频率bin")
+        
+        window, workspace = self._get_fft_buffers(n_fft)
+        # 整个频谱计算流程统一使用float32（FFT结果为complex64），减少内存带宽
+        audio = self.audio_data.astype(np.float32, copy=False)
+        if len(audio) < n_fft:
+            # 音频比一帧还短时在末尾补零
+            audio = np.pad(audio, (0, n_fft - len(audio)))
+        
+        # 帧长为time_window（n_fft），帧移按频谱条数量选取：不做两端补零（center=False），
+        # 帧数为 (len - n_fft) // hop + 1，首帧从音频开头、第num_bars帧不超过音频结尾，
+        # 分帧直接得到num_bars帧，无需再重采样；帧之间是否重叠取决于time_window与帧移的大小
+        hop_length = max(1, (len(audio) - n_fft) // max(1, num_bars - 1))
+        
+        # 分帧，此处仅为视图不复制数据
+        frames = np.lib.stride_tricks.sliding_window_view(audio, n_fft)[::hop_length][:num_bars]
+        n_frames = len(frames)
+        energy = np.empty(n_frames, dtype=np.float32)
+        
+        # 按块计算：加窗 -> 实数FFT -> 频段内幅值平均，避免生成完整的幅度矩阵
+        # 进度条按块更新，只有一块时不显示
+        with tqdm(total=n_frames, desc="计算频谱", unit="帧", disable=not self._show_progress or n_frames <= FRAME_BLOCK_SIZE) as pbar:
+            for start in range(0, n_frames, FRAME_BLOCK_SIZE):
+                stop = min(start + FRAME_BLOCK_SIZE, n_frames)
+                block = np.multiply(frames[start:stop], window, out=workspace[:stop - start])
+                spec = scipy.fft.rfft(block, axis=-1, workers=self._fft_workers)
+                energy[start:stop] = np.abs(spec[:, i0:i1]).mean(axis=1, dtype=np.float32)
+                pbar.update(stop - start)
+        
+        # 音频过短导致帧数不足时，使用多相滤波重采样补齐
         if len(energy) != num_bars:
-            # 使用线性插值重采样
-            x_old = np.linspace(0, 1, len(energy))
-            x_new = np.linspace(0, 1, num_bars)
-            energy = np.interp(x_new, x_old, energy)
+            g = math.gcd(num_bars, len(energy))
+            energy = scipy.signal.resample_poly(energy, num_bars // g, len(energy) // g, padtype='edge')
+            energy = np.maximum(energy, 0).astype(np.float32, copy=False)
         
-        # 归一化能量值到0-1范围
-        if np.max(energy) > 0:
-            energy = energy / np.max(energy)
-        
-        # 应用对数缩放以增强动态范围
-        energy = np.log1p(energy * 10) / np.log1p(10)
+        # 归一化能量值到0-1范围后应用对数缩放以增强动态范围：
+        # log1p(energy / max * 10) / log1p(10)，除以最大值与乘10合并为一次缩放，全部原地计算
+        max_energy = energy.max()
+        energy *= np.float32(10 / max_energy if max_energy > 0 else 10)
+        np.log1p(energy, out=energy)
+        energy *= np.float32(1 / np.log1p(10))
         
         return energy.tolist()
     
+    def _get_fft_buffers(self, n_fft: int) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        获取（并缓存）指定FFT长度的汉宁窗和加窗工作区
+        
+        批量处理时同一实例会处理多个文件，缓存避免每个文件重复生成窗函数和分配缓冲区
+        
+        Args:
+            n_fft: FFT长度
+            
+        Returns:
+            汉宁窗和形状为(FRAME_BLOCK_SIZE, n_fft)的工作区数组的元组
+        """
+        buffers = self._fft_cache.get(n_fft)
+        if buffers is None:
+            window = scipy.signal.get_window('hann', n_fft, fftbins=True).astype(np.float32)
+            workspace = np.empty((FRAME_BLOCK_SIZE, n_fft), dtype=np.float32)
+            buffers = self._fft_cache[n_fft] = (window, workspace)
+        return buffers
+    
     def generate_svg(self, spectrum: List[float], output_file: str = None) -> str:
         """
         生成SVG频谱图
@@ -163,6 +249,7 @@ class AudioSpectrumSVG:
         min_bar_height = svg_config['min_bar_height']
         max_bar_height_percent = svg_config['max_bar_height_percent']
         background_color = svg_config.get('background_color', '')
+        emit_ids = svg_config.get('emit_ids', False)
         
         # 获取对齐配置
         vertical_align = self.config['alignment']['vertical_align']
@@ -181,57 +268,54 @@ class AudioSpectrumSVG:
         # 计算最大频谱条高度
         max_bar_height = svg_height * (max_bar_height_percent / 100.0)
         
-        # 开始生成SVG
-        svg_lines = []
-        svg_lines.append(f'<svg xmlns="http://www.w3.org/2000/svg" width="{svg_width}" height="{svg_height}" viewBox="0 0 {svg_width} {svg_height}">')
+        # 开始生成SVG（所有内容写入同一个缓冲区）
+        buf = io.StringIO()
+        buf.write(f'<svg xmlns="http://www.w3.org/2000/svg" width="{svg_width}" height="{svg_height}" viewBox="0 0 {svg_width} {svg_height}">\n')
         
         # 添加背景色（如果指定）
         if background_color:
-            svg_lines.append(f'  <rect width="{svg_width}" height="{svg_height}" fill="{background_color}"/>')
+            buf.write(f'  <rect width="{svg_width}" height="{svg_height}" fill="{background_color}"/>\n')
         
-        svg_lines.append('  <g id="spectrum">')
+        buf.write('  <g id="spectrum">\n')
         
-        # 生成每个频谱条
-        x_offset = 0
-        with tqdm(total=len(spectrum), desc="生成SVG", unit="条") as pbar:
-            for i, energy in enumerate(spectrum):
-                # 计算频谱条高度
-                bar_height = max(min_bar_height, energy * max_bar_height)
-                
-                # 根据对齐方式计算y坐标
-                if vertical_align == 'center':
-                    y = (svg_height - bar_height) / 2
-                elif vertical_align == 'top':
-                    y = 0
-                elif vertical_align == 'bottom':
-                    y = svg_height - bar_height
-                else:
-                    # 默认居中
-                    y = (svg_height - bar_height) / 2
-                
-                # 生成矩形元素
-                if border_radius > 0:
-                    svg_lines.append(
-                        f'    <rect id="bar_{i}" width="{bar_width}" height="{bar_height:.2f}" '
-                        f'x="{x_offset}" y="{y:.2f}" fill="{bar_color}" rx="{border_radius}" ry="{border_radius}"/>'
-                    )
-                else:
-                    svg_lines.append(
-                        f'    <rect id="bar_{i}" width="{bar_width}" height="{bar_height:.2f}" '
-                        f'x="{x_offset}" y="{y:.2f}" fill="{bar_color}"/>'
-                    )
-                
-                x_offset += bar_width + bar_spacing
-                pbar.update(1)
+        # 预先把每个频谱条共用的属性填入模板，逐条只替换（序号、）高度和坐标
+        if border_radius > 0:
+            rect_attrs = f' fill="{bar_color}" rx="{border_radius}" ry="{border_radius}"'
+        else:
+            rect_attrs = f' fill="{bar_color}"'
+        rect_template = (
+            ('    <rect id="bar_%d"' if emit_ids else '    <rect')
+            + f' width="{bar_width}" height="%.2f" x="%s" y="%.2f"'
+            + rect_attrs.replace('%', '%%') + '/>\n'
+        )
+        
+        # 一次性计算所有频谱条的高度和坐标
+        bar_heights = np.maximum(min_bar_height, np.asarray(spectrum, dtype=np.float64) * max_bar_height)
+        # x坐标按原逐条累加的方式计算（首条为整数0），保证非整数间距时输出与之前一致
+        xs = list(itertools.accumulate(itertools.repeat(bar_width + bar_spacing, num_bars - 1), initial=0))
+        
+        # 根据对齐方式计算y坐标：y = (画布高度 - 条高度) * 偏移系数，未知对齐方式按居中处理
+        offset = ALIGN_OFFSETS.get(vertical_align, ALIGN_OFFSETS['center'])
+        if offset:
+            ys = (svg_height - bar_heights) * offset
+        else:
+            ys = np.zeros_like(bar_heights)
+        
+        # 生成每个频谱条（耗时远低于1秒，不再显示进度条）
+        if emit_ids:
+            bars = zip(range(num_bars), bar_heights.tolist(), xs, ys.tolist())
+        else:
+            bars = zip(bar_heights.tolist(), xs, ys.tolist())
+        buf.writelines(map(rect_template.__mod__, bars))
         
-        svg_lines.append('  </g>')
-        svg_lines.append('</svg>')
+        buf.write('  </g>\n')
+        buf.write('</svg>')
         
-        svg_content = '\n'.join(svg_lines)
+        svg_content = buf.getvalue()
         
-        # 保存SVG文件
-        with open(output_file, 'w', encoding='utf-8') as f:
-            f.write(svg_content)
+        # 保存SVG文件（以字节方式一次性写入大缓冲区）
+        with open(output_file, 'wb', buffering=WRITE_BUFFER_SIZE) as f:
+            f.write(svg_content.encode('utf-8'))
         
         print(f"SVG文件已生成: {output_file}")
         print(f"SVG尺寸: {svg_width}x{svg_height}")
@@ -289,13 +373,14 @@ class AudioSpectrumSVG:
         os.makedirs(output_folder, exist_ok=True)
         
         # 支持的音频格式
-        supported_extensions = ['.wav', '.mp3', '.ogg', '.flac', '.m4a']
+        supported_extensions = {'.wav', '.mp3', '.ogg', '.flac', '.m4a'}
         
-        # 查找所有音频文件
-        audio_files = []
-        for ext in supported_extensions:
-            audio_files.extend(Path(input_folder).glob(f'*{ext}'))
-            audio_files.extend(Path(input_folder).glob(f'*{ext.upper()}'))
+        # 单次遍历文件夹查找所有音频文件（扩展名不区分大小写）
+        with os.scandir(input_folder) as entries:
+            audio_files = sorted(
+                Path(entry.path) for entry in entries
+                if entry.is_file() and os.path.splitext(entry.name)[1].lower() in supported_extensions
+            )
         
         if not audio_files:
             print(f"在文件夹 '{input_folder}' 中未找到支持的音频文件")
@@ -306,26 +391,69 @@ class AudioSpectrumSVG:
         print(f"输出文件夹: {output_folder}")
         print("-" * 60)
         
-        # 批量处理
         success_count = 0
         failed_files = []
-        
-        for i, audio_path in enumerate(audio_files, 1):
-            try:
-                # 生成输出文件名
+        # 同名不同格式的音频（如song.wav和song.mp3）会生成同一个SVG文件，
+        # 并行写入时结果不可预测，因此这些文件保留原扩展名（song.wav.svg、song.mp3.svg）
+        stem_counts = Counter(os.path.normcase(audio_path.stem) for audio_path in audio_files)
+        
+        jobs = []
+        for audio_path in audio_files:
+            # 生成输出文件名
+            if stem_counts[os.path.normcase(audio_path.stem)] > 1:
+                output_filename = audio_path.name + '.svg'
+                print(f"⚠️ 存在同名音频文件，输出文件名保留扩展名: {output_filename}")
+            else:
                 output_filename = audio_path.stem + '.svg'
-                output_path = os.path.join(output_folder, output_filename)
-                
-                print(f"\n[{i}/{len(audio_files)}] 处理: {audio_path.name}")
-                
-                # 处理单个文件
-                self.process(str(audio_path), output_path)
-                
-                success_count += 1
+            output_path = os.path.join(output_folder, output_filename)
+            jobs.append((audio_path, output_path))
+        
+        # 保留扩展名后仍重名的（极少见，如song.wav.mp3与song.wav）不处理，直接记为失败
+        output_counts = Counter(os.path.normcase(output_path) for _, output_path in jobs)
+        for audio_path, output_path in jobs:
+            if output_counts[os.path.normcase(output_path)] > 1:
+                failed_files.append((audio_path.name, f"输出文件与其他音频重名: {output_path}"))
+        jobs = [job for job in jobs if output_counts[os.path.normcase(job[1])] == 1]
+        
+        # 批量处理：每个文件相互独立，分发到多个进程并行处理
+        cpu_count = os.cpu_count() or 1
+        max_workers = max(1, min(len(jobs), cpu_count))
+        if sys.platform == 'win32':
+            # Windows下ProcessPoolExecutor最多支持61个工作进程
+            max_workers = min(max_workers, WINDOWS_MAX_WORKERS)
+        
+        if max_workers == 1:
+            # 只有一个进程可用时直接在当前进程处理，省去启动子进程的开销
+            for i, (audio_path, output_path) in enumerate(jobs, 1):
+                try:
+                    print(f"\n[{i}/{len(jobs)}] 处理: {audio_path.name}")
+                    self.process(str(audio_path), output_path)
+                    success_count += 1
+                except Exception as e:
+                    print(f"❌ 处理失败: {e}")
+                    failed_files.append((audio_path.name, str(e)))
+        else:
+            # 每个进程分到的FFT线程数，文件数少于CPU核心数时仍能用满所有核心
+            fft_workers = max(1, cpu_count // max_workers)
+            print(f"并行进程数: {max_workers}，每个进程FFT线程数: {fft_workers}")
+            
+            with ProcessPoolExecutor(max_workers=max_workers, initializer=_init_worker,
+                                     initargs=(self.config, fft_workers)) as executor:
+                futures = {
+                    executor.submit(_process_one, str(audio_path), output_path): audio_path
+                    for audio_path, output_path in jobs
+                }
                 
-            except Exception as e:
-                print(f"❌ 处理失败: {e}")
-                failed_files.append((audio_path.name, str(e)))
+                for i, future in enumerate(as_completed(futures), 1):
+                    audio_path = futures[future]
+                    try:
+                        output = future.result()
+                        print(f"\n[{i}/{len(jobs)}] ✅ 已处理: {audio_path.name}")
+                        print(output, end='')
+                        success_count += 1
+                    except Exception as e:
+                        print(f"\n[{i}/{len(jobs)}] ❌ 处理失败: {audio_path.name}: {e}")
+                        failed_files.append((audio_path.name, str(e)))
         
         # 输出统计信息
         print("\n" + "=" * 60)
@@ -338,6 +466,33 @@ class AudioSpectrumSVG:
                 print(f"  - {filename}: {error}")
 
 
+# 批量处理子进程中复用的生成器实例
+_worker_generator = None
+
+
+def _init_worker(config: dict, fft_workers: int):
+    """批量处理子进程初始化：创建生成器实例"""
+    global _worker_generator
+    _worker_generator = AudioSpectrumSVG(config=config)
+    # 按分到的线程数限制FFT并行度，避免多个进程同时用满所有核心导致CPU超额占用
+    _worker_generator._fft_workers = fft_workers
+    # 多个进程的进度条会相互穿插，子进程中不显示；stderr保留警告和错误信息
+    _worker_generator._show_progress = False
+
+
+def _process_one(audio_path: str, output_path: str) -> str:
+    """
+    在子进程中处理单个音频文件
+    
+    Returns:
+        处理过程中的输出信息，由主进程统一打印，避免多个进程的输出相互穿插
+    """
+    output = io.StringIO()
+    with contextlib.redirect_stdout(output):
+        _worker_generator.process(audio_path, output_path)
+    return output.getvalue()
+
+
 def main():
     """主函数"""
     import argparse